@@ -0,0 +1,260 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark for the Sudoku generator and solver
+
+Times every solver backend over the reference puzzles and generated sets of
+each size and clue count, and times every generation mode, then prints the
+results as JSON so runs can be compared to catch regressions. Timings are
+taken with the search counters switched off, the counters come from a
+second solve of each puzzle from the same random seed, so both solves
+make the same choices.
+
+Robert Noakes 2020
+
+"""
+
+import argparse
+import json
+import platform
+import time
+import numpy as np
+from Sudoku_Generator_Solver import Generator, Solver, Stats
+
+REFERENCE = {
+    "easy": [
+        "003020600900305001001806400008102900700000008006708200002609500800203009005010300",
+        "200080300060070084030500209000105408000000000402706000301007040720040060004010003",
+        "53..7....6..195....98....6.8...6...34..8.3..17...2...6.6....28....419..5....8..79",
+    ],
+    "hard": [
+        "48.3............71.2.......7.5....6....2..8.............1.76...3.....4......5....",
+        "......52..8.4......3...9...5.1...6..2..7........3.....6...1..........7.4.......3.",
+        "6.2.5.........3.4..........43...8....1....2........7..5..27...........81...6.....",
+        "6.2.5.........4.3..........43...8....1....2........7..5..27...........81...6.....",
+        ".923.........8.1...........1.7.4...........658.........6.5.2...4.....7.....9.....",
+    ],
+    "hardest": [
+        "..53.....8......2..7..1.5..4....53...1..7...6..32...8..6.5....9..4....3......97..",
+        "1....7.9..3..2...8..96..5....53..9...1..8...26....4...3......1..4......7..7...3..",
+        "8..........36......7..9.2...5...7.......457.....1...3...1....68..85...1..9....4..",
+    ],
+}
+
+GENERATED = [(3, 40), (3, 30), (3, 25), (4, 160), (4, 120), (4, 100),
+             (5, 450), (5, 400), (5, 300)]
+
+DFS_LIMIT = 20000
+
+def parse(line):
+    """
+    Converts a 9x9 puzzle written as one line into a 2D array
+
+    Parameters
+    ----------
+    line : TYPE str
+        81 characters read along the rows, "." or "0" for an empty cell
+
+    Returns
+    -------
+    TYPE 2D array
+        Sudoku puzzle
+
+    """
+    cells = [0 if c in ".0" else int(c) for c in line]
+    return [cells[r*9:r*9 + 9] for r in range(9)]
+
+def dfs(solver):
+    """
+    Solver backend running the search once without restarts, giving up
+    after DFS_LIMIT nodes as large puzzles can otherwise run for hours
+
+    Parameters
+    ----------
+    solver : TYPE Solver
+        Solver holding the puzzle
+
+    Returns
+    -------
+    TYPE Boolean
+        True if a solution was found within the node limit
+
+    """
+    cands, places = solver.candidates()
+    if cands is None:
+        return False
+    solver.limit = DFS_LIMIT
+    return solver.search(cands, places) is not None
+
+BACKENDS = {"restarts": Solver.solve, "dfs": dfs}
+
+def bench_set(puzzles, backend):
+    """
+    Times a backend over a set of puzzles and counts its search
+
+    Parameters
+    ----------
+    puzzles : TYPE list
+        2D arrays to solve, left unchanged
+    backend : TYPE str
+        Key in BACKENDS
+
+    Returns
+    -------
+    TYPE dict
+        Timings and counters, totalled over the set and for each puzzle
+
+    """
+    solve = BACKENDS[backend]
+    total = Stats()
+    results = []
+    for puzzle in puzzles:
+        seed = np.random.randint(2**31)
+        solver = Solver([list(row) for row in puzzle])
+        np.random.seed(seed)
+        start = time.perf_counter()
+        solved = solve(solver)
+        seconds = time.perf_counter() - start
+        stats = Stats()
+        np.random.seed(seed)
+        solve(Solver([list(row) for row in puzzle], stats=stats))
+        total.nodes += stats.nodes
+        total.backtracks += stats.backtracks
+        total.propagations += stats.propagations
+        total.max_depth = max(total.max_depth, stats.max_depth)
+        total.restarts += stats.restarts
+        result = {"seconds": seconds, "solved": solved,
+                  "grade": stats.grade()}
+        result.update(stats.as_dict())
+        results.append(result)
+    seconds = [r["seconds"] for r in results]
+    return {"backend": backend, "puzzles": len(puzzles),
+            "solved": sum(r["solved"] for r in results),
+            "seconds": {"total": sum(seconds),
+                        "mean": sum(seconds)/len(seconds),
+                        "max": max(seconds)},
+            "stats": total.as_dict(), "results": results}
+
+def bench_generator(box, clues, count):
+    """
+    Times Generator.make and rates each puzzle it makes
+
+    Parameters
+    ----------
+    box : TYPE int
+        Side length of a box
+    clues : TYPE int
+        Number of filled in elements in each puzzle
+    count : TYPE int
+        Number of puzzles to make
+
+    Returns
+    -------
+    timing : TYPE dict
+        Generation timings and the rating of each puzzle
+    puzzles : TYPE list
+        The generated puzzles
+
+    """
+    puzzles, seconds, ratings = [], [], []
+    for n in range(count):
+        G = Generator(box)
+        start = time.perf_counter()
+        G.make(clues)
+        seconds.append(time.perf_counter() - start)
+        stats = G.rate()
+        rating = stats.as_dict()
+        rating["grade"] = stats.grade()
+        ratings.append(rating)
+        puzzles.append(G.puzzle)
+    timing = {"box": box, "size": box*box, "clues": clues, "puzzles": count,
+              "seconds": {"total": sum(seconds),
+                          "mean": sum(seconds)/count, "max": max(seconds)},
+              "ratings": ratings}
+    return timing, puzzles
+
+def positive(text):
+    """
+    Argument type for a whole number of at least 1
+
+    Parameters
+    ----------
+    text : TYPE str
+        Command line value
+
+    Returns
+    -------
+    TYPE int
+        The value as an integer
+
+    """
+    value = int(text)
+    if value < 1:
+        raise argparse.ArgumentTypeError("must be at least 1, got {}"
+                                         .format(value))
+    return value
+
+def run(count=5, seed=0, max_box=5):
+    """
+    Runs the whole benchmark
+
+    Parameters
+    ----------
+    count : TYPE int, optional
+        Number of puzzles in each generated set
+    seed : TYPE int, optional
+        Seed for numpy's random numbers, so the generated sets repeat
+    max_box : TYPE int, optional
+        Largest box size to generate puzzles for
+
+    Returns
+    -------
+    TYPE dict
+        Benchmark results
+
+    Raises
+    ------
+    ValueError
+        If count is less than 1
+
+    """
+    if count < 1:
+        raise ValueError("count must be at least 1, got {}".format(count))
+    np.random.seed(seed)
+    sets = [(name, 3, [parse(line) for line in lines])
+            for name, lines in REFERENCE.items()]
+    generation = []
+    for box, clues in GENERATED:
+        if box > max_box:
+            continue
+        timing, puzzles = bench_generator(box, clues, count)
+        generation.append(timing)
+        sets.append(("generated_{}x{}_{}".format(box*box, box*box, clues),
+                     box, puzzles))
+    solving = []
+    for name, box, puzzles in sets:
+        for backend in BACKENDS:
+            result = bench_set(puzzles, backend)
+            result["set"] = name
+            result["size"] = box*box
+            solving.append(result)
+    return {"python": platform.python_version(), "numpy": np.__version__,
+            "count": count, "seed": seed,
+            "solving": solving, "generation": generation}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().split("\n")[0])
+    parser.add_argument("--count", type=positive, default=5,
+                        help="puzzles in each generated set")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="random seed for the generated sets")
+    parser.add_argument("--max-box", type=int, default=5,
+                        help="largest box size to generate, 5 for 25x25")
+    parser.add_argument("--output", help="file to write the JSON to")
+    args = parser.parse_args()
+    results = run(args.count, args.seed, args.max_box)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
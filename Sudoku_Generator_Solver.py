@@ -3,51 +3,220 @@
 """
 Sudoku puzzle generator and solver
 
+Works for any N^2 x N^2 puzzle (9x9, 16x16, 25x25...). Candidates for each
+cell are stored as integer bitsets, bit d-1 set meaning digit d is possible,
+and the rows, columns, boxes and peers of every cell come from lookup tables
+built once per box size.
+
 Robert Noakes 2020
 
 """
 
+import numbers
 import numpy as np
 
+_TABLES = {}
+
+def lookup_tables(box):
+    """
+    Builds (or fetches the cached) lookup tables for a given box size
+
+    Cells are numbered 0 to size^2 - 1 reading along the rows, where
+    size = box^2 is the side length of the puzzle.
+
+    Parameters
+    ----------
+    box : TYPE int
+        Side length of a box, 3 for a standard 9x9 puzzle
+
+    Returns
+    -------
+    box_of : TYPE list
+        Index of the box containing each cell
+    units : TYPE list
+        Cells in every row, then every column, then every box
+    cell_units : TYPE list
+        (row, column, box) indices into units for each cell
+    cell_pos : TYPE list
+        Position of each cell within its row, column and box
+    peers : TYPE list
+        Every other cell sharing a row, column or box with each cell
+
+    """
+    if box not in _TABLES:
+        size = box*box
+        cells = range(size*size)
+        rows = [[r*size + c for c in range(size)] for r in range(size)]
+        cols = [[r*size + c for r in range(size)] for c in range(size)]
+        boxes = [[(br*box + i)*size + bc*box + j
+                  for i in range(box) for j in range(box)]
+                 for br in range(box) for bc in range(box)]
+        units = rows + cols + boxes
+        box_of = [(c//size)//box*box + (c%size)//box for c in cells]
+        cell_units = [(c//size, size + c%size, 2*size + box_of[c])
+                      for c in cells]
+        cell_pos = [(c%size, c//size, (c//size)%box*box + (c%size)%box)
+                    for c in cells]
+        peers = [tuple(sorted((set(units[cell_units[c][0]])
+                               | set(units[cell_units[c][1]])
+                               | set(units[cell_units[c][2]])) - {c}))
+                 for c in cells]
+        _TABLES[box] = (box_of, units, cell_units, cell_pos, peers)
+    return _TABLES[box]
+
+def popcount(mask):
+    """
+    Number of candidates in a bitset
+    """
+    return bin(mask).count("1")
+
+if hasattr(int, "bit_count"):
+    popcount = int.bit_count
+
+class Stats():
+    """
+    Search counters for a solve, also used as a difficulty rating
+
+    nodes counts calls to Solver.search, backtracks the guesses that had to
+    be undone, propagations the candidates removed and max_depth the most
+    guesses in force at once. Attempts that Solver.restarts gives up on
+    are included, up to the node where they hit the limit, and restarts
+    counts how many there were.
+    """
+
+    def __init__(self):
+        """
+        Initialises all of the counters to zero
+
+        Returns
+        -------
+        None.
+
+        """
+        self.nodes = 0
+        self.backtracks = 0
+        self.propagations = 0
+        self.max_depth = 0
+        self.restarts = 0
+
+    def __repr__(self):
+        """
+        Makes the class instance call a readable format
+        """
+        return "Stats({})".format(", ".join(
+            "{}={}".format(k, v) for k, v in self.as_dict().items()))
+
+    def as_dict(self):
+        """
+        Returns
+        -------
+        TYPE dict
+            Counters keyed by name, ready to dump as JSON
+
+        """
+        return {"nodes": self.nodes, "backtracks": self.backtracks,
+                "propagations": self.propagations,
+                "max_depth": self.max_depth, "restarts": self.restarts}
+
+    def grade(self):
+        """
+        Rates a puzzle from the counters of Solver.rate
+
+        Returns
+        -------
+        TYPE str
+            "easy" if propagation alone solved it, "medium" if every guess
+            was right first time, "hard" if the search had to backtrack
+
+        """
+        if self.max_depth == 0:
+            return "easy"
+        if self.backtracks == 0:
+            return "medium"
+        return "hard"
+
 class Solver():
     """
     Class that solves a sudoku puzzle
     """
 
-    def __init__(self, puzzle):
+    def __init__(self, puzzle, box=None, stats=None):
         """
         Initialises the Solver class with the puzzle to solve
 
         Parameters
         ----------
-        puzzle : TYPE Class instance or 9x9 2D array
+        puzzle : TYPE Class instance or N^2xN^2 2D array
             Sudoku puzzzle to be solved
+        box : TYPE int, optional
+            Side length of a box, worked out from the puzzle if not given
+        stats : TYPE Stats, optional
+            Counters to add the search statistics to, not counted if None
 
         Returns
         -------
         None.
 
         """
+        if box is None:
+            box = int(round(len(puzzle)**0.5))
+        self.setup(box)
+        size = self.size
+        if len(puzzle) != size or any(len(row) != size for row in puzzle):
+            raise ValueError("puzzle must be an N^2xN^2 grid, expected "
+                             "{0}x{0} for box size {1}".format(size, box))
+        if any(not 0 <= n <= size for row in puzzle for n in row):
+            raise ValueError("puzzle entries must be between 0 and {}"
+                             .format(size))
         self.puzzle = puzzle
-    
+        self.stats = stats
+
+    def setup(self, box):
+        """
+        Stores the puzzle dimensions and lookup tables for a box size
+
+        Parameters
+        ----------
+        box : TYPE int
+            Side length of a box
+
+        Returns
+        -------
+        None.
+
+        Raises
+        ------
+        ValueError
+            If box is not an integer of at least 1
+
+        """
+        if (not isinstance(box, numbers.Integral) or isinstance(box, bool)
+                or box < 1):
+            raise ValueError("box must be an integer of at least 1, got {!r}"
+                             .format(box))
+        box = int(box)
+        self.box = box
+        self.size = box*box
+        self.full = (1 << self.size) - 1
+        (self.box_of, self.units, self.cell_units, self.cell_pos,
+         self.peers) = lookup_tables(box)
+        self.shuffle = False
+        self.nodes = 0
+        self.limit = None
+        self.weights = [1]*(3*self.size)
+
     def __repr__(self):
         """
         Makes the class instance call a readable format
         """
-        return " {}\n {}\n {}\n {}\n {}\n {}\n {}\n {}\n {}\n".format(
-            self.puzzle[0], self.puzzle[1], self.puzzle[2], self.puzzle[3], 
-            self.puzzle[4], self.puzzle[5], self.puzzle[6], self.puzzle[7], 
-            self.puzzle[8])
-    
+        return "".join(" {}\n".format(row) for row in self.puzzle)
+
     def __str__(self):
         """
         Return a string to print of the puzzle in a readable form.
         """
-        return " {}\n {}\n {}\n {}\n {}\n {}\n {}\n {}\n {}\n".format(
-            self.puzzle[0], self.puzzle[1], self.puzzle[2], self.puzzle[3], 
-            self.puzzle[4], self.puzzle[5], self.puzzle[6], self.puzzle[7], 
-            self.puzzle[8])
-    
+        return "".join(" {}\n".format(row) for row in self.puzzle)
+
     def __getitem__(self, index):
         """
         Parameters
@@ -61,7 +230,7 @@ class Solver():
         """
         i, j = index
         return self.puzzle[i][j]
-    
+
     def __setitem__(self, index):
         """
         Parameters
@@ -75,7 +244,7 @@ class Solver():
         """
         i, j = index
         return self.puzzle[i][j]
-        
+
     def num_count(self, row, elem):
         """
         Counts the number of a given integer in a row
@@ -93,20 +262,20 @@ class Solver():
             Number of "elem" in "row"
 
         """
-        count = 0 
+        count = 0
         for i in row:
             if i == elem:
                 count += 1
         return count
-    
+
     def rule(self, grid, row, test):
         """
         Boolean implementation of Sudoku logic
-        
+
         Parameters
         ----------
         grid : TYPE 2D array
-            The grid to test, either the puzzle, puzzle transpose or box list 
+            The grid to test, either the puzzle, puzzle transpose or box list
         row : TYPE int
             Row in puzzle to check
         test : TYPE int
@@ -122,11 +291,11 @@ class Solver():
             return True
         else:
             return False
-    
+
     def row_rule(self, i, test):
         """
         Sudoku row rule
-        
+
         Parameters
         ----------
         i : TYPE int
@@ -145,7 +314,7 @@ class Solver():
     def column_rule(self, j, test):
         """
         Sudoku column rule
-        
+
         Parameters
         ----------
         j : TYPE int
@@ -157,20 +326,20 @@ class Solver():
         -------
         TYPE Boolean
             True if test is allowed in j
-            
+
 
         """
         return self.rule([list(a) for a in list(zip(*self.puzzle))], j, test)
-    
+
     def box_rule(self, q, r, test):
         """
-        Converts Sudoku boxes into rows for testing
+        Sudoku box rule, reading the cells of the box from the unit table
 
         Parameters
         ----------
         q : TYPE = int
             Row to test
-        r : TYPE 
+        r : TYPE
             Column to test
         test : TYPE
             Number to test in location
@@ -181,16 +350,9 @@ class Solver():
             True if test is allowd in position i, j in the puzzle
 
         """
-        tl = [self.puzzle[i][j] for i in range(0,3) for j in range(0,3)]
-        tm = [self.puzzle[i][j] for i in range(0,3) for j in range(3,6)]
-        tr = [self.puzzle[i][j] for i in range(0,3) for j in range(6,9)]
-        ml = [self.puzzle[i][j] for i in range(3,6) for j in range(0,3)]
-        mm = [self.puzzle[i][j] for i in range(3,6) for j in range(3,6)]
-        mr = [self.puzzle[i][j] for i in range(3,6) for j in range(6,9)]
-        bl = [self.puzzle[i][j] for i in range(6,9) for j in range(0,3)]
-        bm = [self.puzzle[i][j] for i in range(6,9) for j in range(3,6)]
-        br = [self.puzzle[i][j] for i in range(6,9) for j in range(6,9)]
-        return self.rule([tl, tm, tr, ml, mm, mr, bl, bm, br], self.which_box(q, r), test)
+        box = self.units[2*self.size + self.which_box(q, r)]
+        return all(self.puzzle[c//self.size][c%self.size] != test
+                   for c in box)
 
     def which_box(self, i, j):
         """
@@ -209,27 +371,7 @@ class Solver():
             Row in the box list to test
 
         """
-        if i < 3:
-            if j < 3:
-                return 0
-            if j < 6:
-                return 1
-            if j < 9:
-                return 2
-        if i < 6:
-            if j < 3:
-                return 3
-            if j < 6:
-                return 4
-            if j < 9:
-                return 5
-        if i < 9:
-            if j < 3:
-                return 6
-            if j < 6:
-                return 7
-            if j < 9:
-                return 8
+        return self.box_of[i*self.size + j]
 
     def elem_checker(self, i, j, test):
         """
@@ -261,6 +403,242 @@ class Solver():
         else:
             return False
 
+    def candidates(self):
+        """
+        Converts the puzzle into a list of candidate bitsets, one per cell,
+        with every given already propagated to its peers
+
+        Returns
+        -------
+        cands : TYPE list or None
+            Candidate bitsets, None if the givens contradict each other
+        places : TYPE list or None
+            Bitsets of the positions in unit u that can still hold digit
+            d + 1, at index u*size + d
+
+        """
+        cands = [self.full]*(self.size*self.size)
+        places = [self.full]*(3*self.size*self.size)
+        queue = []
+        for i, row in enumerate(self.puzzle):
+            for j, n in enumerate(row):
+                if n:
+                    queue.append((i*self.size + j, self.full & ~(1 << (n-1))))
+        if not self.propagate(cands, places, queue):
+            return None, None
+        return cands, places
+
+    def propagate(self, cands, places, queue):
+        """
+        Removes candidates and follows the consequences. A cell with one
+        candidate left is removed from its peers, a digit with one place
+        left in a row, column or box is placed there, and a digit whose
+        places in a box all lie on one line (or whose places on a line all
+        lie in one box) is removed from the rest of that line (or box).
+        The unit (or the units of the cell) left with no options has its
+        weight raised.
+
+        Parameters
+        ----------
+        cands : TYPE list
+            Candidate bitsets, changed in place
+        places : TYPE list
+            Position bitsets for each unit and digit, changed in place
+        queue : TYPE list
+            (cell, bitset) pairs of candidates to remove
+
+        Returns
+        -------
+        TYPE Boolean
+            False if a cell or unit is left with no options
+
+        """
+        peers, units, cell_units = self.peers, self.units, self.cell_units
+        cell_pos, box_of = self.cell_pos, self.box_of
+        size, box = self.size, self.box
+        segment = (1 << box) - 1
+        stripe = sum(1 << i*box for i in range(box))
+        stats, weights = self.stats, self.weights
+        while queue:
+            cell, mask = queue.pop()
+            removed = cands[cell] & mask
+            if not removed:
+                continue
+            left = cands[cell] ^ removed
+            if not left:
+                for u in cell_units[cell]:
+                    weights[u] += 1
+                return False
+            cands[cell] = left
+            if stats is not None:
+                stats.propagations += 1
+            if not left & (left-1):
+                for p in peers[cell]:
+                    if cands[p] & left:
+                        queue.append((p, left))
+            while removed:
+                bit = removed & -removed
+                removed ^= bit
+                d = bit.bit_length() - 1
+                for n in range(3):
+                    u = cell_units[cell][n]
+                    k = u*size + d
+                    pos = places[k] & ~(1 << cell_pos[cell][n])
+                    places[k] = pos
+                    if not pos:
+                        weights[u] += 1
+                        return False
+                    low = (pos & -pos).bit_length() - 1
+                    if pos == 1 << low:
+                        s = units[u][low]
+                        if cands[s] != bit:
+                            queue.append((s, cands[s] & ~bit))
+                        continue
+                    if n == 2:
+                        b = u - 2*size
+                        if not pos & ~(segment << low//box*box):
+                            line = b//box*box + low//box
+                        elif not pos & ~(stripe << low%box):
+                            line = size + b%box*box + low%box
+                        else:
+                            continue
+                    elif not pos & ~(segment << low//box*box):
+                        line = 2*size + box_of[units[u][low]]
+                    else:
+                        continue
+                    for s in units[line]:
+                        if cands[s] & bit and u not in cell_units[s]:
+                            queue.append((s, bit))
+        return True
+
+    def search(self, cands, places, depth=0):
+        """
+        Depth first search, branching on a digit with only two places left
+        in a row, column or box if there is no cell with two candidates,
+        otherwise on the cell with the fewest candidates left. Ties go to
+        the units that have failed most often so far, so the search keeps
+        working on the part of the grid that contradicts its guesses.
+
+        Parameters
+        ----------
+        cands : TYPE list
+            Propagated candidate bitsets
+        places : TYPE list
+            Position bitsets for each unit and digit
+        depth : TYPE int, optional
+            Number of guesses made to reach this node
+
+        Returns
+        -------
+        TYPE list or None
+            Solved candidate bitsets, None if there is no solution or the
+            node limit ran out
+
+        """
+        self.nodes += 1
+        if self.limit is not None and self.nodes > self.limit:
+            return None
+        stats = self.stats
+        if stats is not None:
+            stats.nodes += 1
+            if depth > stats.max_depth:
+                stats.max_depth = depth
+        weights, cell_units = self.weights, self.cell_units
+        best, fewest, heavy = [], self.size + 1, 0
+        for cell, mask in enumerate(cands):
+            if mask & (mask-1):
+                n = popcount(mask)
+                if n <= fewest:
+                    u = cell_units[cell]
+                    w = weights[u[0]] + weights[u[1]] + weights[u[2]]
+                    if n < fewest or w > heavy:
+                        best, fewest, heavy = [cell], n, w
+                    elif w == heavy:
+                        best.append(cell)
+        if not best:
+            return cands
+        pairs, heavy = [], 0
+        if fewest > 2:
+            size = self.size
+            for k, pos in enumerate(places):
+                pos &= pos - 1
+                if pos and not pos & (pos-1):
+                    w = weights[k//size]
+                    if w > heavy:
+                        pairs, heavy = [k], w
+                    elif w == heavy:
+                        pairs.append(k)
+        if self.shuffle:
+            pair = pairs[np.random.randint(len(pairs))] if pairs else None
+            best = best[np.random.randint(len(best))]
+        else:
+            pair = pairs[0] if pairs else None
+            best = best[0]
+        if pair is not None:
+            unit, digit = divmod(pair, self.size)
+            bit = 1 << digit
+            options = [(s, bit) for s in self.units[unit] if cands[s] & bit]
+        else:
+            options = []
+            mask = cands[best]
+            while mask:
+                bit = mask & -mask
+                mask ^= bit
+                options.append((best, bit))
+        if self.shuffle:
+            np.random.shuffle(options)
+        for cell, bit in options:
+            trial, trial_places = cands[:], places[:]
+            if self.propagate(trial, trial_places,
+                              [(cell, trial[cell] & ~bit)]):
+                result = self.search(trial, trial_places, depth+1)
+                if result is not None:
+                    return result
+                if self.limit is not None and self.nodes > self.limit:
+                    return None
+            if stats is not None:
+                stats.backtracks += 1
+        return None
+
+    def restarts(self, cands, places):
+        """
+        Runs the search with a node limit that doubles after each failed
+        attempt, shuffling the branch order after the first one. An early
+        wrong guess in a large puzzle can otherwise take an exponential
+        number of nodes to back out of. The first limit, 16 nodes per cell,
+        covers a plain search of most generated puzzles (about 10000 nodes
+        for 25x25 where the median is near 4000) so those are not cut off
+        and repeated. The unit weights carry over from one attempt to the
+        next and start again for each solve.
+
+        Parameters
+        ----------
+        cands : TYPE list
+            Propagated candidate bitsets
+        places : TYPE list
+            Position bitsets for each unit and digit
+
+        Returns
+        -------
+        TYPE list or None
+            Solved candidate bitsets, None if there is no solution
+
+        """
+        shuffle = self.shuffle
+        self.weights = [1]*(3*self.size)
+        self.limit = max(1, 16*self.size**2)
+        while True:
+            self.nodes = 0
+            result = self.search(cands, places)
+            if result is not None or self.nodes <= self.limit:
+                break
+            self.limit *= 2
+            self.shuffle = True
+            if self.stats is not None:
+                self.stats.restarts += 1
+        self.shuffle, self.limit = shuffle, None
+        return result
+
     def check(self):
         """
         Function used in Generator to check if a partially generated
@@ -272,64 +650,77 @@ class Solver():
             True if a given partial puzzle has a solution
 
         """
-        for i in range(9):
-            for j in range(9):
-                if self.puzzle[i][j] == 0: 
-                    for n in range(1, 10):
-                        if self.elem_checker(i, j, n):
-                            self.puzzle[i][j] = n
-                            if not any(0 in row for row in self.puzzle):
-                                self.bool = True
-                                break
-                            self.check()
-                            self.puzzle[i][j] = 0
-                    return self.bool
+        cands, places = self.candidates()
+        return cands is not None and self.restarts(cands, places) is not None
 
     def solve(self):
         """
-        Solves and prints the solution to the sudoku puzzle
+        Solves the sudoku puzzle, filling in the solution in place
 
-        Raises
-        ------
-        SystemExit
-            Stops the process when a solution is found
+        Returns
+        -------
+        TYPE Boolean
+            True if a solution was found
+
+        """
+        cands, places = self.candidates()
+        if cands is None:
+            return False
+        cands = self.restarts(cands, places)
+        if cands is None:
+            return False
+        for cell, mask in enumerate(cands):
+            self.puzzle[cell//self.size][cell%self.size] = mask.bit_length()
+        return True
+
+    def rate(self):
+        """
+        Solves a copy of the puzzle with fresh counters to rate how hard
+        it is, see Stats.grade. Any restarts are shuffled from a fixed seed,
+        so the rating is repeatable, and numpy's random state is put back
+        afterwards so rating a puzzle does not change what is generated next.
 
         Returns
         -------
-        None.
+        TYPE Stats
+            Search counters for the solve
 
         """
-        for i in range(9):
-            for j in range(9):
-                if self.puzzle[i][j] == 0:
-                    for n in range(1, 10):
-                        if self.elem_checker(i, j, n):
-                            self.puzzle[i][j] = n
-                            if not any(0 in row for row in self.puzzle):
-                                print(self)
-                                print("")
-                                raise SystemExit("Solved!")
-                            self.solve()
-                            self.puzzle[i][j] = 0
-                    return
-                
+        state = np.random.get_state()
+        np.random.seed(0)
+        try:
+            solver = Solver([list(row) for row in self.puzzle], self.box,
+                            Stats())
+            solver.solve()
+        finally:
+            np.random.set_state(state)
+        return solver.stats
+
 class Generator(Solver):
     """
     Class that generates a random sudoku puzzle
     """
-    
-    def __init__(self):
+
+    def __init__(self, box=3, stats=None):
         """
-        Initialises the class with an initial 9x9 2D array of zeros 
+        Initialises the class with an initial N^2xN^2 2D array of zeros
+
+        Parameters
+        ----------
+        box : TYPE int, optional
+            Side length of a box, 3 for a standard 9x9 puzzle
+        stats : TYPE Stats, optional
+            Counters to add the search statistics to, not counted if None
 
         Returns
         -------
         None.
 
         """
-        self.puzzle = [[0,0,0,0,0,0,0,0,0] for x in range(9)]
-        self.bool = False
-        
+        self.setup(box)
+        self.stats = stats
+        self.puzzle = [[0]*self.size for x in range(self.size)]
+
     def make(self, num):
         """
         Generates a sudoku puzzle to solve
@@ -344,24 +735,29 @@ class Generator(Solver):
         TYPE Instance
             Sudoku puzzle to solve
 
+        Raises
+        ------
+        ValueError
+            If num is not between 0 and the number of cells in the puzzle
+
         """
-        for i in range(9):
-            for j in range(9):
-                while any(0 in row for row in self.puzzle):
-                    x = np.random.randint(1,10)
-                    if self.elem_checker(i, j, x):
-                        self.puzzle[i][j] = x
-                    if not self.check():
-                        self.puzzle[i][j] = 0
-                for q in range(81-num):
-                    r, c = np.random.randint(0,9), np.random.randint(0,9)
-                    while self.puzzle[r][c] == 0:
-                        r, c = np.random.randint(0,9), np.random.randint(0,9)
-                    self.puzzle[r][c] = 0
-                return self.puzzle
+        if not 0 <= num <= self.size**2:
+            raise ValueError("num must be between 0 and {}"
+                             .format(self.size**2))
+        self.puzzle = [[0]*self.size for x in range(self.size)]
+        self.shuffle = True
+        self.solve()
+        self.shuffle = False
+        for q in np.random.permutation(self.size**2)[:self.size**2-num]:
+            self.puzzle[q//self.size][q%self.size] = 0
+        return self.puzzle
 
 if __name__ == "__main__":
     G = Generator()
     G.make(30)
     print(G)
-    G.solve()
\ No newline at end of file
+    print(G.rate().grade())
+    S = Solver([row[:] for row in G.puzzle])
+    if S.solve():
+        print(S)
+        print("Solved!")